@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark: integer amount parser and integer aggregation vs the old float versions
+So sánh bộ đọc số tiền và phép cộng tổng kiểu số nguyên với bản dùng float cũ
+
+The parser cases below are checked first, so a run also verifies parse_amount.
+The integer parser is not faster than float(): integers run at about the
+same speed and decimals take roughly twice as long, in exchange for exact
+amounts and the extended forms.
+
+Usage: python benchmarks/bench_amounts.py [rows]
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from spending_bot import parse_amount
+
+def parse_amount_float(amount_str):
+    """The float-based parser replaced by parse_amount"""
+    try:
+        amount_str = amount_str.lower().strip()
+        if amount_str.endswith('m'):
+            return float(amount_str[:-1]) * 1000000
+        elif amount_str.endswith('k'):
+            return float(amount_str[:-1]) * 1000
+        else:
+            return float(amount_str) * 1000
+    except ValueError:
+        raise ValueError("Số tiền không hợp lệ")
+
+# Inputs both parsers accept
+SAMPLES = ['50', '15k', '200k', '1.5m', '5m', '8.2m', '1.005k', '35.5k', '120', '2.25m']
+
+# Forms only the new parser accepts
+EXTENDED_SAMPLES = ['1,200k', '2m5', '12,500', '3k5', '1,200.5k']
+
+# Expected parse_amount results in VND
+CASES = {
+    '50': 50000,
+    ' 5M ': 5000000,
+    '1.5m': 1500000,
+    '.5m': 500000,
+    '1.005k': 1005,
+    '1200': 1200000,
+    '1,200': 1200000,
+    '1,200k': 1200000,
+    '1,200,000k': 1200000000,
+    '1,200.5k': 1200500,
+    '2m5': 2500000,
+    '2m05': 2050000,
+    '3k5': 3500,
+}
+
+# Inputs parse_amount must reject
+INVALID = [
+    '', 'abc', 'k', 'm5', ',5m', '.', '1.', '1.5m5', '0.0001', '1.5.5', '1 200', '5mk', '-5',
+    '1,5m', '1,20k', '1,2000', '1,200,000',
+]
+
+def check_parser():
+    failures = [f"{s!r} -> {parse_amount(s)!r}, expected {v!r}" for s, v in CASES.items() if parse_amount(s) != v]
+    for s in INVALID:
+        try:
+            failures.append(f"{s!r} -> {parse_amount(s)!r}, expected ValueError")
+        except ValueError:
+            pass
+    if failures:
+        raise AssertionError("parse_amount:\n  " + "\n  ".join(failures))
+    print(f"Parser cases: {len(CASES)} valid and {len(INVALID)} invalid inputs ok\n")
+
+def bench_parsers(number=20000):
+    print("Parser (%d x %d inputs)" % (number, len(SAMPLES)))
+    integers = [s for s in SAMPLES if '.' not in s]
+    decimals = [s for s in SAMPLES if '.' in s]
+    for label, samples in (('all', SAMPLES), ('integers', integers), ('decimals', decimals)):
+        for name, parser in (('float (old)', parse_amount_float), ('integer (new)', parse_amount)):
+            seconds = min(timeit.repeat(lambda: [parser(s) for s in samples], number=number, repeat=3))
+            per_call = seconds / (number * len(samples)) * 1e9
+            print(f"  {label:<9} {name:<14} {seconds:.3f}s  ({per_call:.0f} ns/call)")
+    
+    seconds = min(timeit.repeat(lambda: [parse_amount(s) for s in EXTENDED_SAMPLES], number=number, repeat=3))
+    per_call = seconds / (number * len(EXTENDED_SAMPLES)) * 1e9
+    print(f"  {'extended forms':<24} {seconds:.3f}s  ({per_call:.0f} ns/call, new parser only)")
+    
+    drift = [s for s in SAMPLES if parse_amount_float(s) != parse_amount(s)]
+    print(f"  inputs where the float parser is not exact: {', '.join(drift) or 'none'}")
+
+def bench_aggregation(rows):
+    print(f"\nSUM over {rows:,} rows")
+    random.seed(0)
+    amounts = [random.choice(SAMPLES) for _ in range(rows)]
+    
+    for name, column_type, parser in (
+        ('REAL (old)', 'REAL', parse_amount_float),
+        ('INTEGER (new)', 'INTEGER', parse_amount),
+    ):
+        conn = sqlite3.connect(':memory:')
+        conn.execute(f'CREATE TABLE transactions (category TEXT, amount {column_type})')
+        conn.executemany(
+            'INSERT INTO transactions VALUES (?, ?)',
+            ((str(i % 7), parser(a)) for i, a in enumerate(amounts))
+        )
+        query = 'SELECT category, SUM(amount) FROM transactions GROUP BY category'
+        seconds = min(timeit.repeat(lambda: conn.execute(query).fetchall(), number=5, repeat=3)) / 5
+        total = conn.execute('SELECT SUM(amount) FROM transactions').fetchone()[0]
+        print(f"  {name:<14} {seconds * 1000:.1f} ms/query  total={total!r}")
+        conn.close()
+    
+    exact = sum(parse_amount(a) for a in amounts)
+    print(f"  exact total    {exact!r}")
+
+if __name__ == '__main__':
+    check_parser()
+    bench_parsers()
+    bench_aggregation(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
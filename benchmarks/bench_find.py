@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /find full-text search against a per-chat LIKE scan
+Đo tốc độ tìm kiếm /find so với LIKE trên nhiều triệu giao dịch
+
+Usage: python benchmarks/bench_find.py [rows] [chats]
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import spending_bot
+
+WORDS = [
+    'cafe', 'grab', 'pho', 'com', 'bun', 'tra', 'sua', 'xang', 'dien', 'nuoc',
+    'internet', 'phim', 'sach', 'ao', 'giay', 'thuoc', 'cho', 'sieu', 'thi', 'banh',
+    'taxi', 'be', 'gojek', 'lau', 'nuong', 'kem', 'bia', 'ruou', 'qua', 'sinh',
+]
+
+QUERIES = [['cafe'], ['cafe', 'grab'], ['gojek', 'lau', 'kem']]
+
+# One busy group ledger holds this share of all rows, the rest are spread evenly
+BIG_CHAT = -1
+BIG_CHAT_SHARE = 0.1
+
+def populate(rows, chats):
+    random.seed(0)
+    conn = sqlite3.connect(spending_bot.DB_PATH)
+    batch = 50000
+    for start in range(0, rows, batch):
+        conn.executemany('''
+            INSERT INTO transactions (chat_id, user_id, type, amount, category, description, date)
+            VALUES (?, ?, 'chi', ?, 'eat', ?, ?)
+        ''', [
+            (
+                BIG_CHAT if random.random() < BIG_CHAT_SHARE else random.randrange(1, chats),
+                1,
+                random.randrange(1, 500) * 1000,
+                " ".join(random.sample(WORDS, 3)),
+                f"2024-{random.randrange(1, 13):02d}-{random.randrange(1, 29):02d} 12:00:00",
+            )
+            for _ in range(start, min(rows, start + batch))
+        ])
+        conn.commit()
+    conn.close()
+
+def like_search(chat_id, terms):
+    """Per-chat LIKE scan returning the same rows and totals as /find"""
+    conn = sqlite3.connect(spending_bot.DB_PATH)
+    conditions = " AND ".join("description LIKE ?" for _ in terms)
+    params = [chat_id] + [f'%{term}%' for term in terms]
+    rows = conn.execute(f'''
+        SELECT type, amount, category, description, date FROM transactions
+        WHERE chat_id = ? AND {conditions}
+        ORDER BY date DESC LIMIT 20
+    ''', params).fetchall()
+    totals = conn.execute(f'''
+        SELECT type, SUM(amount), COUNT(*) FROM transactions
+        WHERE chat_id = ? AND {conditions}
+        GROUP BY type
+    ''', params).fetchall()
+    conn.close()
+    return rows, totals
+
+def main(rows, chats):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        spending_bot.DB_PATH = os.path.join(tmp_dir, 'spending.db')
+        spending_bot.init_db()
+        
+        started = time.perf_counter()
+        populate(rows, chats)
+        print(f"Inserted {rows:,} rows over {chats:,} chats in {time.perf_counter() - started:.1f}s")
+        
+        for chat_id, label in ((1, 'typical chat'), (BIG_CHAT, 'busy group')):
+            print(f"{label}:")
+            for terms in QUERIES:
+                for name, search in (
+                    ('fts (/find)', lambda: spending_bot.search_transactions(chat_id, terms)),
+                    ('like', lambda: like_search(chat_id, terms)),
+                ):
+                    seconds = min(timeit.repeat(search, number=5, repeat=3)) / 5
+                    print(f"  {' '.join(terms):<16} {name:<12} {seconds * 1000:8.2f} ms")
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 1000000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 2000,
+    )
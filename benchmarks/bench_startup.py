@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bot cold start (module import, init_db) and the Hanoi clock
+Đo thời gian khởi động bot và chi phí lấy giờ Hà Nội
+
+Usage: python benchmarks/bench_startup.py [runs]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import spending_bot
+
+def bench_import(runs):
+    """Import time of spending_bot in a fresh interpreter"""
+    code = (
+        "import sys, time; sys.path.insert(0, %r); t = time.perf_counter(); "
+        "import spending_bot; print(time.perf_counter() - t)" % ROOT
+    )
+    samples = [
+        float(subprocess.check_output([sys.executable, '-c', code]))
+        for _ in range(runs)
+    ]
+    loaded = subprocess.check_output([
+        sys.executable, '-c',
+        "import sys; sys.path.insert(0, %r); import spending_bot; "
+        "print(sorted(m for m in ('telegram', 'dotenv', 'pytz') if m in sys.modules))" % ROOT
+    ]).decode().strip()
+    print(f"import spending_bot: {statistics.median(samples) * 1000:.1f} ms median of {runs}")
+    print(f"  heavy modules loaded at import: {loaded}")
+
+def bench_init_db(runs):
+    """init_db on a new database and on an up-to-date one"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        spending_bot.DB_PATH = os.path.join(tmp_dir, 'spending.db')
+        first = timeit.timeit(spending_bot.init_db, number=1)
+        again = min(timeit.repeat(spending_bot.init_db, number=1, repeat=runs))
+    print(f"init_db, new database: {first * 1000:.2f} ms")
+    print(f"init_db, up to date:   {again * 1000:.3f} ms")
+
+def bench_clock(number=100000):
+    """get_hanoi_time against a per-call pytz lookup, when pytz is installed"""
+    seconds = timeit.timeit(spending_bot.get_hanoi_time, number=number)
+    print(f"get_hanoi_time (fixed offset): {seconds / number * 1e9:.0f} ns/call")
+    try:
+        import pytz
+    except ImportError:
+        print("  pytz not installed, skipping comparison")
+        return
+    from datetime import datetime
+    tz = pytz.timezone('Asia/Ho_Chi_Minh')
+    seconds = timeit.timeit(lambda: datetime.now(tz), number=number)
+    print(f"datetime.now(pytz tz):         {seconds / number * 1e9:.0f} ns/call")
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    bench_import(runs)
+    bench_init_db(runs)
+    bench_clock()
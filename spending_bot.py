@@ -1,17 +1,26 @@
+from __future__ import annotations
+
+import asyncio
+import calendar
+import glob
+import heapq
 import logging
+import re
 import sqlite3
-from datetime import datetime
-import pytz
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, BotCommand
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+import time
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
 import os
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+# telegram, dotenv and the backup/CLI modules are imported where they are
+# used, so startup (and --backup/--restore) only pays for what it needs
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import ContextTypes
 
-# Hanoi timezone (GMT+7)
-HANOI_TZ = pytz.timezone('Asia/Ho_Chi_Minh')
+# Hanoi timezone (GMT+7). Vietnam has no daylight saving time, so a fixed
+# offset is exact and avoids a tz database lookup on every call
+HANOI_TZ = timezone(timedelta(hours=7), 'ICT')
 
 def get_hanoi_time():
     """Get current time in Hanoi timezone"""
@@ -33,36 +42,268 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Database setup
-def init_db():
-    conn = sqlite3.connect('spending.db')
-    cursor = conn.cursor()
+DB_PATH = 'spending.db'
+
+# FTS5 token naming a ledger; chat IDs can be negative, and "-" would split
+# the token, so it is spelled "n" (chat -100 -> cn100)
+FTS_CHAT_TOKEN_SQL = "'c' || replace({chat_id}, '-', 'n')"
+
+def fts_chat_token(chat_id):
+    return 'c' + str(chat_id).replace('-', 'n')
+
+def migrate_baseline(cursor):
+    """Migration 1: tạo schema hiện tại, chuyển dữ liệu từ bản phát hành đầu
     
-    # Create transactions table (renamed from expenses to handle both income and expenses)
+    The first release kept transactions and budgets per user with REAL
+    amounts and no version. Those tables are renamed aside, the current
+    schema is created, and their rows are copied over in one pass: the
+    user ID becomes both the ledger (a private chat's ID equals the
+    user's ID) and the member, and amounts are rounded to integer VND.
+    Running totals and the search index are then filled set-based,
+    before their triggers exist."""
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
+        SELECT name FROM sqlite_master
+        WHERE type = 'table' AND name IN ('transactions', 'budgets')
+    ''')
+    legacy = {row[0] for row in cursor.fetchall()}
+    for table in legacy:
+        cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_legacy')
+    
+    # Transactions (income and expenses). chat_id is the ledger (a private
+    # chat or a group), user_id the member who recorded it
+    cursor.execute('''
+        CREATE TABLE transactions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
             user_id INTEGER NOT NULL,
             type TEXT NOT NULL,
-            amount REAL NOT NULL,
+            amount INTEGER NOT NULL,
             category TEXT NOT NULL,
             description TEXT,
-            date TEXT NOT NULL
+            date TEXT NOT NULL,
+            message_id INTEGER
         )
     ''')
     
     # Create budgets table
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS budgets (
+        CREATE TABLE budgets (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            alert_level INTEGER NOT NULL DEFAULT 0,
+            UNIQUE(chat_id, category, month)
+        )
+    ''')
+    
+    if 'transactions' in legacy:
+        cursor.execute('''
+            INSERT INTO transactions (id, chat_id, user_id, type, amount, category, description, date)
+            SELECT id, user_id, user_id, type, CAST(ROUND(amount) AS INTEGER), category, description, date
+            FROM transactions_legacy
+        ''')
+    
+    if 'budgets' in legacy:
+        cursor.execute('''
+            INSERT INTO budgets (id, chat_id, category, amount, month)
+            SELECT id, user_id, category, CAST(ROUND(amount) AS INTEGER), month
+            FROM budgets_legacy
+        ''')
+    
+    for table in legacy:
+        # Keep AUTOINCREMENT from reusing IDs of rows deleted before the upgrade
+        cursor.execute('DELETE FROM sqlite_sequence WHERE name = ?', (table,))
+        cursor.execute('UPDATE sqlite_sequence SET name = ? WHERE name = ?', (table, f'{table}_legacy'))
+        cursor.execute(f'DROP TABLE {table}_legacy')
+    
+    cursor.execute('CREATE INDEX idx_transactions_chat_date ON transactions (chat_id, date)')
+    
+    # The Telegram message a transaction came from. The unique index turns a
+    # redelivered or retried update into a no-op insert
+    cursor.execute('''
+        CREATE UNIQUE INDEX idx_transactions_message
+        ON transactions (chat_id, message_id)
+    ''')
+    
+    # Display names of ledger members, for per-member group summaries
+    cursor.execute('''
+        CREATE TABLE members (
+            chat_id INTEGER NOT NULL,
             user_id INTEGER NOT NULL,
+            name TEXT,
+            PRIMARY KEY (chat_id, user_id)
+        )
+    ''')
+    
+    # Running totals per ledger/type/category/month, kept in sync by triggers
+    # so budget checks are a primary-key lookup instead of a re-aggregation
+    cursor.execute('''
+        CREATE TABLE monthly_totals (
+            chat_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
             category TEXT NOT NULL,
-            amount REAL NOT NULL,
             month TEXT NOT NULL,
-            UNIQUE(user_id, category, month)
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, type, category, month)
         )
     ''')
     
-    conn.commit()
+    cursor.execute('''
+        INSERT INTO monthly_totals (chat_id, type, category, month, total)
+        SELECT chat_id, type, category, substr(date, 1, 7), SUM(amount)
+        FROM transactions
+        GROUP BY chat_id, type, category, substr(date, 1, 7)
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER transactions_totals_insert
+        AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO monthly_totals (chat_id, type, category, month, total)
+            VALUES (new.chat_id, new.type, new.category, substr(new.date, 1, 7), new.amount)
+            ON CONFLICT (chat_id, type, category, month)
+            DO UPDATE SET total = total + excluded.total;
+        END
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER transactions_totals_delete
+        AFTER DELETE ON transactions
+        BEGIN
+            UPDATE monthly_totals SET total = total - old.amount
+            WHERE chat_id = old.chat_id AND type = old.type
+              AND category = old.category AND month = substr(old.date, 1, 7);
+        END
+    ''')
+    
+    # Create recurring transactions table (salaries, subscriptions, ...)
+    cursor.execute('''
+        CREATE TABLE recurring (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            description TEXT,
+            day INTEGER NOT NULL,
+            next_run TEXT NOT NULL,
+            message_id INTEGER
+        )
+    ''')
+    cursor.execute('CREATE INDEX idx_recurring_chat ON recurring (chat_id)')
+    cursor.execute('CREATE INDEX idx_recurring_next_run ON recurring (next_run)')
+    
+    # Recurring rules record their source message like transactions do
+    cursor.execute('''
+        CREATE UNIQUE INDEX idx_recurring_message
+        ON recurring (chat_id, message_id)
+    ''')
+    
+    # /delete and /clear messages that already ran, so a redelivered
+    # update cannot remove more data
+    cursor.execute('''
+        CREATE TABLE handled_commands (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, message_id)
+        )
+    ''')
+    
+    # Full-text index over descriptions (diacritics are folded so "ca phe"
+    # also finds "cà phê"). It is contentless with a chat column holding
+    # the ledger's token, so a search matches the chat inside the index
+    # and only reads that ledger's postings. Prefix indexes for 2-6
+    # characters let the usual short search words ("caf", "gojek") skip
+    # through postings like exact terms instead of merging every matching
+    # term's doclist
+    cursor.execute('''
+        CREATE VIRTUAL TABLE transactions_fts USING fts5(
+            chat,
+            description,
+            content='',
+            prefix='2 3 4 5 6',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    
+    new_token = FTS_CHAT_TOKEN_SQL.format(chat_id='new.chat_id')
+    old_token = FTS_CHAT_TOKEN_SQL.format(chat_id='old.chat_id')
+    
+    cursor.execute(f'''
+        INSERT INTO transactions_fts (rowid, chat, description)
+        SELECT id, {FTS_CHAT_TOKEN_SQL.format(chat_id='chat_id')}, description
+        FROM transactions
+    ''')
+    
+    cursor.execute(f'''
+        CREATE TRIGGER transactions_fts_insert
+        AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (rowid, chat, description)
+            VALUES (new.id, {new_token}, new.description);
+        END
+    ''')
+    
+    # A contentless index deletes by replaying the values it was given
+    cursor.execute(f'''
+        CREATE TRIGGER transactions_fts_delete
+        AFTER DELETE ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, chat, description)
+            VALUES ('delete', old.id, {old_token}, old.description);
+        END
+    ''')
+    
+    cursor.execute(f'''
+        CREATE TRIGGER transactions_fts_update
+        AFTER UPDATE OF chat_id, description ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, chat, description)
+            VALUES ('delete', old.id, {old_token}, old.description);
+            INSERT INTO transactions_fts (rowid, chat, description)
+            VALUES (new.id, {new_token}, new.description);
+        END
+    ''')
+
+# Schema migrations in order; PRAGMA user_version stores how many have run
+MIGRATIONS = [
+    migrate_baseline,
+]
+
+def init_db():
+    """Khởi tạo hoặc nâng cấp cơ sở dữ liệu
+    
+    An up-to-date database costs a PRAGMA read and a no-op journal_mode
+    PRAGMA at startup. Pending migrations each run in their own BEGIN
+    IMMEDIATE transaction with the version bump, re-reading the version
+    under the write lock so two processes starting together never run
+    a migration twice. The database is kept in WAL mode so backups can
+    read a snapshot while the bot writes."""
+    conn = sqlite3.connect(DB_PATH)
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    
+    conn.isolation_level = None
+    cursor = conn.cursor()
+    while version < len(MIGRATIONS):
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            # Re-read under the write lock: another process starting at the
+            # same time may already have run this migration
+            version = cursor.execute('PRAGMA user_version').fetchone()[0]
+            if version < len(MIGRATIONS):
+                MIGRATIONS[version](cursor)
+                version += 1
+                cursor.execute(f'PRAGMA user_version = {version}')
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+    
+    # Persistent, and a no-op once set
+    conn.execute('PRAGMA journal_mode = WAL')
     conn.close()
 
 # Categories for income and expenses
@@ -81,116 +322,222 @@ EXPENSE_CATEGORIES = {
     'ano': '📦 Khác'
 }
 
+# Budget usage percentages that trigger a warning after /out
+BUDGET_ALERT_THRESHOLDS = (80, 100)
+
+# Hour of day (Hanoi time) at which recurring transactions are recorded
+RECURRING_HOUR = 8
+
+# Upper bound on a single scheduler sleep, so clock jumps are picked up
+RECURRING_MAX_SLEEP = 3600
+
+# Delay before retrying a failed batch of recurring transactions
+RECURRING_RETRY_DELAY = 60
+
+# Rules recorded per write transaction, so a large batch releases the write
+# lock between chunks and handlers never wait long. The pause (seconds)
+# lets a waiting handler's busy retry take the lock before the next chunk
+RECURRING_CHUNK_SIZE = 2000
+RECURRING_CHUNK_PAUSE = 0.02
+
+# Multipliers for amount suffixes, in VND
+AMOUNT_UNITS = {'k': 1000, 'm': 1000000}
+
+# Digits with optional comma-grouped thousands, an optional decimal part,
+# then an optional suffix with digits as its fraction (2m5). A comma is
+# only ever a thousands separator followed by exactly three digits
+AMOUNT_PATTERN = re.compile(
+    r'([0-9]{1,3}(?:,[0-9]{3})+|[0-9]*)'
+    r'(?:\.([0-9]+))?'
+    r'(?:(?<=[0-9])([km])([0-9]*))?'
+)
+
 def parse_amount(amount_str):
-    """Parse amount string with support for 'k' (thousand) and 'm' (million) suffix
-    Numbers without suffix are automatically treated as 'k' (thousands)"""
-    try:
-        amount_str = amount_str.lower().strip()
-        if amount_str.endswith('m'):
-            # Remove 'm' and multiply by 1,000,000
-            number_part = amount_str[:-1]
-            return float(number_part) * 1000000
-        elif amount_str.endswith('k'):
-            # Remove 'k' and multiply by 1,000
-            number_part = amount_str[:-1]
-            return float(number_part) * 1000
-        else:
-            # No suffix = automatically treat as 'k' (thousands)
-            return float(amount_str) * 1000
-    except ValueError:
+    """Parse amount string into integer VND with 'k' (thousand) and 'm' (million) suffix
+    Numbers without suffix are automatically treated as 'k' (thousands),
+    including grouped ones (1,200 = 1,200k); a bare number with more than
+    one thousands group (1,200,000) is ambiguous and rejected. Also
+    accepts decimals (1.5m, .5m), separators with a suffix (1,200k) and
+    digits after the suffix as a fraction of it (2m5 = 2,500,000).
+    
+    Integers and decimals are handled with string methods; only grouped
+    numbers and 2m5-style fractions go through AMOUNT_PATTERN. Only
+    integer arithmetic is used, so there is no float rounding."""
+    text = amount_str.strip().lower()
+    
+    # The usual inputs: 50, 15k, 5m, 1.5m, .5m
+    unit = AMOUNT_UNITS.get(text[-1:])
+    number = text[:-1] if unit else text
+    if number.isdecimal():
+        return int(number) * (unit or 1000)
+    whole, dot, fraction = number.partition('.')
+    if dot and fraction.isdecimal() and (whole.isdecimal() or not whole):
+        amount, remainder = divmod(int(whole + fraction) * (unit or 1000), 10 ** len(fraction))
+        if remainder:
+            raise ValueError("Số tiền không hợp lệ")
+        return amount
+    
+    match = AMOUNT_PATTERN.fullmatch(text)
+    if not match:
+        raise ValueError("Số tiền không hợp lệ")
+    grouped, fraction, suffix, suffix_digits = match.groups()
+    whole = grouped.replace(',', '')
+    if not whole and not fraction:
+        raise ValueError("Số tiền không hợp lệ")
+    if not suffix and grouped.count(',') > 1:
         raise ValueError("Số tiền không hợp lệ")
+    if suffix_digits:
+        # 1.5m5 has two fractions
+        if fraction:
+            raise ValueError("Số tiền không hợp lệ")
+        fraction = suffix_digits
+    fraction = fraction or ''
+    
+    # No suffix = automatically treat as 'k' (thousands)
+    unit = AMOUNT_UNITS[suffix] if suffix else 1000
+    amount, remainder = divmod(int(whole + fraction) * unit, 10 ** len(fraction))
+    if remainder:
+        raise ValueError("Số tiền không hợp lệ")
+    return amount
 
 # Helper functions
-def add_transaction(user_id, transaction_type, amount, category, description=""):
-    conn = sqlite3.connect('spending.db')
+def add_transaction(chat_id, user_id, transaction_type, amount, category, description="",
+                    member_name=None, message_id=None):
+    """Ghi giao dịch, trả về False nếu tin nhắn này đã được ghi trước đó
+    
+    Duplicate deliveries of the same (chat_id, message_id) hit the unique
+    index and are skipped without a read-before-write check."""
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     date = get_hanoi_time().strftime('%Y-%m-%d %H:%M:%S')
     
     cursor.execute('''
-        INSERT INTO transactions (user_id, type, amount, category, description, date)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (user_id, transaction_type, amount, category, description, date))
+        INSERT INTO transactions (chat_id, user_id, type, amount, category, description, date, message_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT DO NOTHING
+    ''', (chat_id, user_id, transaction_type, amount, category, description, date, message_id))
+    inserted = cursor.rowcount > 0
+    
+    if member_name:
+        cursor.execute('''
+            INSERT INTO members (chat_id, user_id, name) VALUES (?, ?, ?)
+            ON CONFLICT (chat_id, user_id) DO UPDATE SET name = excluded.name
+        ''', (chat_id, user_id, member_name))
     
     conn.commit()
     conn.close()
+    return inserted
+
+def month_range(month):
+    """Khoảng ngày [đầu tháng, đầu tháng sau) để truy vấn theo chỉ mục"""
+    year, mon = map(int, month.split('-'))
+    next_month = f'{year + 1}-01' if mon == 12 else f'{year}-{mon + 1:02d}'
+    return f'{month}-01', f'{next_month}-01'
 
-def get_monthly_summary(user_id, month=None):
+def get_monthly_summary(chat_id, month=None):
     if month is None:
         month = get_hanoi_time().strftime('%Y-%m')
     
-    conn = sqlite3.connect('spending.db')
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
+    # Read the maintained running totals, so the cost does not grow with
+    # the number of transactions or group members
     # Get income
     cursor.execute('''
-        SELECT category, SUM(amount) FROM transactions 
-        WHERE user_id = ? AND type = 'thu' AND date LIKE ?
-        GROUP BY category
-    ''', (user_id, f'{month}%'))
+        SELECT category, total FROM monthly_totals
+        WHERE chat_id = ? AND type = 'thu' AND month = ? AND total != 0
+    ''', (chat_id, month))
     income = cursor.fetchall()
     
     # Get expenses
     cursor.execute('''
-        SELECT category, SUM(amount) FROM transactions 
-        WHERE user_id = ? AND type = 'chi' AND date LIKE ?
-        GROUP BY category
-    ''', (user_id, f'{month}%'))
+        SELECT category, total FROM monthly_totals
+        WHERE chat_id = ? AND type = 'chi' AND month = ? AND total != 0
+    ''', (chat_id, month))
     expenses = cursor.fetchall()
     
     conn.close()
     return income, expenses
 
-def get_monthly_spending(user_id, month=None):
+def get_member_summary(chat_id, month=None):
+    """Tổng thu chi theo thành viên của một sổ nhóm
+    
+    One query over the (chat_id, date) index, grouped by member, so there
+    is no per-member loop. Returns (user_id, name, income, expenses) rows."""
     if month is None:
         month = get_hanoi_time().strftime('%Y-%m')
+    start, end = month_range(month)
     
-    conn = sqlite3.connect('spending.db')
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
     cursor.execute('''
-        SELECT category, SUM(amount) FROM transactions 
-        WHERE user_id = ? AND type = 'chi' AND date LIKE ?
-        GROUP BY category
-    ''', (user_id, f'{month}%'))
+        SELECT t.user_id, m.name,
+               SUM(CASE WHEN t.type = 'thu' THEN t.amount ELSE 0 END),
+               SUM(CASE WHEN t.type = 'chi' THEN t.amount ELSE 0 END)
+        FROM transactions t
+        LEFT JOIN members m ON m.chat_id = t.chat_id AND m.user_id = t.user_id
+        WHERE t.chat_id = ? AND t.date >= ? AND t.date < ?
+        GROUP BY t.user_id
+        ORDER BY 4 DESC
+    ''', (chat_id, start, end))
     
     results = cursor.fetchall()
     conn.close()
     return results
 
-def set_budget(user_id, category, amount):
-    conn = sqlite3.connect('spending.db')
+def set_budget(chat_id, category, amount):
+    """Đặt ngân sách tháng cho danh mục
+    
+    Updating an existing budget keeps the alerts already sent this month,
+    except thresholds the new amount puts spending back under, which can
+    fire again."""
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     month = get_hanoi_time().strftime('%Y-%m')
     
     cursor.execute('''
-        INSERT OR REPLACE INTO budgets (user_id, category, amount, month)
+        SELECT total FROM monthly_totals
+        WHERE chat_id = ? AND type = 'chi' AND category = ? AND month = ?
+    ''', (chat_id, category, month))
+    row = cursor.fetchone()
+    spent = row[0] if row else 0
+    reached = max(
+        (threshold for threshold in BUDGET_ALERT_THRESHOLDS if spent * 100 >= threshold * amount),
+        default=0
+    )
+    
+    cursor.execute('''
+        INSERT INTO budgets (chat_id, category, amount, month)
         VALUES (?, ?, ?, ?)
-    ''', (user_id, category, amount, month))
+        ON CONFLICT (chat_id, category, month)
+        DO UPDATE SET amount = excluded.amount, alert_level = MIN(alert_level, ?)
+    ''', (chat_id, category, amount, month, reached))
     
     conn.commit()
     conn.close()
 
-def get_budget_status(user_id):
-    conn = sqlite3.connect('spending.db')
+def get_budget_status(chat_id):
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     month = get_hanoi_time().strftime('%Y-%m')
     
-    # Get budgets for current month
+    # Get budgets for current month with spending from the running totals
     cursor.execute('''
-        SELECT category, amount FROM budgets 
-        WHERE user_id = ? AND month = ?
-    ''', (user_id, month))
-    
-    budgets = dict(cursor.fetchall())
-    
-    # Get spending for current month
-    spending = dict(get_monthly_spending(user_id, month))
+        SELECT b.category, b.amount, COALESCE(t.total, 0)
+        FROM budgets b
+        LEFT JOIN monthly_totals t
+            ON t.chat_id = b.chat_id AND t.type = 'chi'
+            AND t.category = b.category AND t.month = b.month
+        WHERE b.chat_id = ? AND b.month = ?
+    ''', (chat_id, month))
     
+    rows = cursor.fetchall()
     conn.close()
     
     status = []
-    for category, budget_amount in budgets.items():
-        spent = spending.get(category, 0)
+    for category, budget_amount, spent in rows:
         remaining = budget_amount - spent
         percentage = (spent / budget_amount) * 100 if budget_amount > 0 else 0
         
@@ -204,71 +551,548 @@ def get_budget_status(user_id):
     
     return status
 
-def get_recent_transactions(user_id, limit=10):
+def check_budget_alert(chat_id, category):
+    """Kiểm tra ngưỡng ngân sách sau khi thêm chi tiêu
+    
+    Only reads the budget row and its running total, so the check is O(1)
+    per insert. Returns the newly crossed threshold (80 or 100) with the
+    spent/budget amounts, or None. Each threshold fires once per month."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    month = get_hanoi_time().strftime('%Y-%m')
+    
+    cursor.execute('''
+        SELECT b.amount, b.alert_level, COALESCE(t.total, 0)
+        FROM budgets b
+        LEFT JOIN monthly_totals t
+            ON t.chat_id = b.chat_id AND t.type = 'chi'
+            AND t.category = b.category AND t.month = b.month
+        WHERE b.chat_id = ? AND b.category = ? AND b.month = ?
+    ''', (chat_id, category, month))
+    
+    row = cursor.fetchone()
+    if not row or row[0] <= 0:
+        conn.close()
+        return None
+    
+    budget_amount, alert_level, spent = row
+    percentage = (spent / budget_amount) * 100
+    
+    crossed = None
+    for threshold in BUDGET_ALERT_THRESHOLDS:
+        if percentage >= threshold and alert_level < threshold:
+            crossed = threshold
+    
+    if crossed:
+        # Guard on the old level so concurrent inserts only alert once
+        cursor.execute('''
+            UPDATE budgets SET alert_level = ?
+            WHERE chat_id = ? AND category = ? AND month = ? AND alert_level < ?
+        ''', (crossed, chat_id, category, month, crossed))
+        conn.commit()
+        if cursor.rowcount == 0:
+            crossed = None
+    
+    conn.close()
+    
+    if crossed is None:
+        return None
+    return {
+        'threshold': crossed,
+        'budget': budget_amount,
+        'spent': spent,
+        'percentage': percentage
+    }
+
+def get_recent_transactions(chat_id, limit=10):
     """Lấy các giao dịch gần đây"""
-    conn = sqlite3.connect('spending.db')
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
     cursor.execute('''
-        SELECT type, amount, category, description, date 
-        FROM transactions 
-        WHERE user_id = ? 
-        ORDER BY date DESC 
+        SELECT t.type, t.amount, t.category, t.description, t.date, m.name
+        FROM transactions t
+        LEFT JOIN members m ON m.chat_id = t.chat_id AND m.user_id = t.user_id
+        WHERE t.chat_id = ?
+        ORDER BY t.date DESC
         LIMIT ?
-    ''', (user_id, limit))
+    ''', (chat_id, limit))
     
     results = cursor.fetchall()
     conn.close()
     return results
 
-def delete_last_transaction(user_id):
-    """Xóa giao dịch cuối cùng"""
-    conn = sqlite3.connect('spending.db')
+def build_search_query(chat_id, terms):
+    """Chuyển từ khóa tìm kiếm thành truy vấn FTS5
+    
+    The query is pinned to the ledger's chat token, and every word must
+    match the description as a prefix ("caf" finds "cafe"); words are
+    quoted so user input can never be parsed as FTS5 syntax."""
+    words = re.findall(r'\w+', " ".join(terms))
+    if not words:
+        return ""
+    phrases = " AND ".join(f'description : "{word}"*' for word in words)
+    return f'chat : "{fts_chat_token(chat_id)}" AND {phrases}'
+
+def search_transactions(chat_id, terms, month=None, limit=20):
+    """Tìm giao dịch theo mô tả bằng chỉ mục FTS5
+    
+    The FTS subquery runs once and yields the matching rowids, which are
+    then looked up by primary key. Returns the most recent matching rows
+    (at most limit) together with {type: (total, count)} over all matches."""
+    query = build_search_query(chat_id, terms)
+    if not query:
+        return [], {}
+    
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
+    conditions = 't.id IN (SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ?)'
+    params = [query]
+    if month:
+        conditions += ' AND t.date >= ? AND t.date < ?'
+        params.extend(month_range(month))
+    
+    cursor.execute(f'''
+        SELECT t.type, t.amount, t.category, t.description, t.date
+        FROM transactions t
+        WHERE {conditions}
+        ORDER BY t.date DESC
+        LIMIT ?
+    ''', params + [limit])
+    rows = cursor.fetchall()
+    
+    cursor.execute(f'''
+        SELECT t.type, SUM(t.amount), COUNT(*)
+        FROM transactions t
+        WHERE {conditions}
+        GROUP BY t.type
+    ''', params)
+    totals = {trans_type: (total, count) for trans_type, total, count in cursor.fetchall()}
+    
+    conn.close()
+    return rows, totals
+
+def claim_command_message(cursor, chat_id, message_id):
+    """Ghi nhận tin nhắn lệnh, trả về False nếu đã xử lý trước đó
+    
+    The insert also opens the write transaction, so the claim and the
+    command's own changes commit together."""
+    if message_id is None:
+        return True
+    cursor.execute('''
+        INSERT INTO handled_commands (chat_id, message_id) VALUES (?, ?)
+        ON CONFLICT DO NOTHING
+    ''', (chat_id, message_id))
+    return cursor.rowcount > 0
+
+def delete_last_transaction(chat_id, user_id, message_id=None):
+    """Xóa giao dịch cuối cùng của thành viên trong sổ
+    
+    Returns the deleted row, None if there was nothing to delete, or
+    False if this /delete message was already handled."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    if not claim_command_message(cursor, chat_id, message_id):
+        conn.close()
+        return False
+    
     # Get the last transaction
     cursor.execute('''
         SELECT id, type, amount, category, description, date
         FROM transactions 
-        WHERE user_id = ? 
+        WHERE chat_id = ? AND user_id = ?
         ORDER BY date DESC 
         LIMIT 1
-    ''', (user_id,))
+    ''', (chat_id, user_id))
     
     result = cursor.fetchone()
     if result:
         # Delete the transaction
         cursor.execute('DELETE FROM transactions WHERE id = ?', (result[0],))
-        conn.commit()
     
+    conn.commit()
     conn.close()
     return result
 
-def clear_all_data(user_id):
-    """Xóa toàn bộ dữ liệu của người dùng"""
-    conn = sqlite3.connect('spending.db')
+def clear_all_data(chat_id, message_id=None):
+    """Xóa toàn bộ dữ liệu của sổ (cá nhân hoặc nhóm)
+    
+    Returns None if this /clear message was already handled, so a
+    redelivery cannot wipe transactions recorded after it."""
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
+    if not claim_command_message(cursor, chat_id, message_id):
+        conn.close()
+        return None
+    
     # Count data before deletion
-    cursor.execute('SELECT COUNT(*) FROM transactions WHERE user_id = ?', (user_id,))
+    cursor.execute('SELECT COUNT(*) FROM transactions WHERE chat_id = ?', (chat_id,))
     transaction_count = cursor.fetchone()[0]
     
-    cursor.execute('SELECT COUNT(*) FROM budgets WHERE user_id = ?', (user_id,))
+    cursor.execute('SELECT COUNT(*) FROM budgets WHERE chat_id = ?', (chat_id,))
     budget_count = cursor.fetchone()[0]
     
     # Delete all transactions
-    cursor.execute('DELETE FROM transactions WHERE user_id = ?', (user_id,))
+    cursor.execute('DELETE FROM transactions WHERE chat_id = ?', (chat_id,))
     
     # Delete all budgets
-    cursor.execute('DELETE FROM budgets WHERE user_id = ?', (user_id,))
+    cursor.execute('DELETE FROM budgets WHERE chat_id = ?', (chat_id,))
+    
+    # Drop the running totals left behind by the deletes
+    cursor.execute('DELETE FROM monthly_totals WHERE chat_id = ?', (chat_id,))
+    
+    cursor.execute('SELECT COUNT(*) FROM recurring WHERE chat_id = ?', (chat_id,))
+    recurring_count = cursor.fetchone()[0]
+    
+    # Delete all recurring rules
+    cursor.execute('DELETE FROM recurring WHERE chat_id = ?', (chat_id,))
+    
+    cursor.execute('DELETE FROM members WHERE chat_id = ?', (chat_id,))
+    
+    conn.commit()
+    conn.close()
+    
+    return transaction_count, budget_count, recurring_count
+
+def next_recurring_run(day, after):
+    """Tính lần chạy tiếp theo của giao dịch định kỳ sau thời điểm after
+    
+    Days past the end of a month are clamped, so day 31 runs on Feb 28/29."""
+    year, month = after.year, after.month
+    while True:
+        last_day = calendar.monthrange(year, month)[1]
+        run = datetime(year, month, min(day, last_day), RECURRING_HOUR)
+        if run > after:
+            return run.strftime('%Y-%m-%d %H:%M:%S')
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+def add_recurring(chat_id, user_id, transaction_type, amount, category, description, day,
+                  message_id=None):
+    """Thêm giao dịch định kỳ, trả về (id, lần chạy tiếp theo)
+    
+    A redelivered (chat_id, message_id) hits the unique index and returns
+    the rule created by the first delivery instead of a duplicate."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    now = get_hanoi_time().replace(tzinfo=None)
+    next_run = next_recurring_run(day, now)
+    
+    cursor.execute('''
+        INSERT INTO recurring (chat_id, user_id, type, amount, category, description, day, next_run, message_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT DO NOTHING
+    ''', (chat_id, user_id, transaction_type, amount, category, description, day, next_run, message_id))
+    rule_id = cursor.lastrowid
+    if cursor.rowcount == 0:
+        cursor.execute(
+            'SELECT id, next_run FROM recurring WHERE chat_id = ? AND message_id = ?',
+            (chat_id, message_id)
+        )
+        rule_id, next_run = cursor.fetchone()
     
     conn.commit()
     conn.close()
+    return rule_id, next_run
+
+def get_recurring(chat_id):
+    """Lấy danh sách giao dịch định kỳ"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT id, type, amount, category, description, day, next_run
+        FROM recurring
+        WHERE chat_id = ?
+        ORDER BY id
+    ''', (chat_id,))
+    
+    results = cursor.fetchall()
+    conn.close()
+    return results
+
+def remove_recurring(chat_id, rule_id):
+    """Xóa giao dịch định kỳ của sổ"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
     
-    return transaction_count, budget_count
+    cursor.execute('DELETE FROM recurring WHERE id = ? AND chat_id = ?', (rule_id, chat_id))
+    deleted = cursor.rowcount > 0
+    
+    conn.commit()
+    conn.close()
+    return deleted
+
+def get_recurring_schedule():
+    """Lấy (lần chạy tiếp theo, id) của toàn bộ giao dịch định kỳ"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT next_run, id FROM recurring')
+    
+    results = cursor.fetchall()
+    conn.close()
+    return results
+
+# The run after a rule's current one, computed in SQL: the rule's day in
+# the following month, clamped to that month's last day, at the same time
+NEXT_RECURRING_RUN_SQL = '''
+    strftime('%Y-%m-', next_run, 'start of month', '+1 month')
+    || printf('%02d', min(day, CAST(strftime('%d', next_run, 'start of month', '+2 month', '-1 day') AS INTEGER)))
+    || substr(next_run, 11)
+'''
+
+def run_due_recurring(now):
+    """Ghi toàn bộ giao dịch định kỳ đến hạn theo từng đợt
+    
+    Each rule is recorded once, dated at its scheduled run, and moved to its
+    following run. Rules are claimed RECURRING_CHUNK_SIZE at a time into a
+    temporary table; each chunk is one BEGIN IMMEDIATE transaction with a
+    set-based insert and update, so the write lock is only held for a
+    bounded time and several workers running the scheduler never record
+    the same run twice. Chunks repeat until nothing is due, which also
+    catches up rules that missed several months. Returns the new
+    (next_run, id) pairs to reschedule."""
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    cursor = conn.cursor()
+    cursor.execute('CREATE TEMP TABLE due_recurring (id INTEGER PRIMARY KEY)')
+    
+    updates = []
+    try:
+        while True:
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.execute('DELETE FROM due_recurring')
+                cursor.execute('''
+                    INSERT INTO due_recurring (id)
+                    SELECT id FROM recurring WHERE next_run <= ? LIMIT ?
+                ''', (now, RECURRING_CHUNK_SIZE))
+                if cursor.rowcount == 0:
+                    cursor.execute('COMMIT')
+                    break
+                
+                cursor.execute('''
+                    INSERT INTO transactions (chat_id, user_id, type, amount, category, description, date)
+                    SELECT chat_id, user_id, type, amount, category, description, next_run
+                    FROM recurring
+                    WHERE id IN due_recurring
+                ''')
+                cursor.execute(f'''
+                    UPDATE recurring SET next_run = {NEXT_RECURRING_RUN_SQL}
+                    WHERE id IN due_recurring
+                ''')
+                cursor.execute('SELECT next_run, id FROM recurring WHERE id IN due_recurring')
+                chunk = cursor.fetchall()
+                cursor.execute('COMMIT')
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+            updates.extend(chunk)
+            time.sleep(RECURRING_CHUNK_PAUSE)
+    finally:
+        conn.close()
+    
+    return updates
+
+class RecurringScheduler:
+    """Bộ lập lịch giao dịch định kỳ
+    
+    A single asyncio task sleeps until the earliest entry of a min-heap of
+    (next_run, rule_id) instead of keeping one timer per rule. The heap only
+    decides when to wake up: the recurring table stays the source of truth,
+    so entries of removed rules simply cause an empty run."""
+    
+    def __init__(self):
+        self.heap = []
+        self.wakeup = None
+        self.task = None
+    
+    def load(self):
+        self.heap = get_recurring_schedule()
+        heapq.heapify(self.heap)
+    
+    def schedule(self, rule_id, next_run):
+        heapq.heappush(self.heap, (next_run, rule_id))
+        if self.wakeup is not None:
+            self.wakeup.set()
+    
+    def start(self):
+        self.load()
+        self.task = asyncio.create_task(self.run())
+    
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+    
+    async def run(self):
+        self.wakeup = asyncio.Event()
+        while True:
+            self.wakeup.clear()
+            now = get_hanoi_time().replace(tzinfo=None)
+            
+            if self.heap and self.heap[0][0] <= now.strftime('%Y-%m-%d %H:%M:%S'):
+                await self.fire(now)
+                continue
+            
+            timeout = RECURRING_MAX_SLEEP
+            if self.heap:
+                next_run = datetime.strptime(self.heap[0][0], '%Y-%m-%d %H:%M:%S')
+                timeout = min(timeout, (next_run - now).total_seconds())
+            
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def fire(self, now):
+        now_str = now.strftime('%Y-%m-%d %H:%M:%S')
+        while self.heap and self.heap[0][0] <= now_str:
+            heapq.heappop(self.heap)
+        
+        # The batch insert runs off the event loop so handlers stay responsive
+        loop = asyncio.get_running_loop()
+        try:
+            updates = await loop.run_in_executor(None, run_due_recurring, now_str)
+        except Exception:
+            logger.exception("Lỗi ghi giao dịch định kỳ")
+            retry_at = now + timedelta(seconds=RECURRING_RETRY_DELAY)
+            heapq.heappush(self.heap, (retry_at.strftime('%Y-%m-%d %H:%M:%S'), 0))
+            return
+        
+        for next_run, rule_id in updates:
+            heapq.heappush(self.heap, (next_run, rule_id))
+        if updates:
+            logger.info("Recorded %d recurring transactions", len(updates))
+
+recurring_scheduler = RecurringScheduler()
+
+# Leftover *.partial files older than this (seconds) come from a backup
+# that crashed, rather than one still being written by another process
+BACKUP_STALE_PARTIAL = 3600
+
+def backup_database(backup_dir, compress=True, keep=7):
+    """Sao lưu cơ sở dữ liệu trong khi bot vẫn đang chạy
+    
+    VACUUM INTO copies the database in a single pass inside one read
+    transaction, so the snapshot is consistent and always completes: in
+    WAL mode (set by init_db) the bot keeps writing meanwhile and nothing
+    restarts the copy, unlike the online backup API. The snapshot is
+    written under a temporary name and renamed when complete, then older
+    snapshots beyond keep are removed. Returns the backup path."""
+    import gzip
+    import shutil
+    
+    os.makedirs(backup_dir, exist_ok=True)
+    path = os.path.join(backup_dir, f"spending-{get_hanoi_time():%Y%m%d-%H%M%S}.db")
+    partial = path + '.partial'
+    
+    try:
+        source = sqlite3.connect(DB_PATH)
+        try:
+            source.execute('VACUUM INTO ?', (partial,))
+        finally:
+            source.close()
+        
+        if compress:
+            with open(partial, 'rb') as f_in, gzip.open(partial + '.gz', 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+            os.remove(partial)
+            partial += '.gz'
+            path += '.gz'
+        os.replace(partial, path)
+    except BaseException:
+        for leftover in (partial, partial + '.gz'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    
+    rotate_backups(backup_dir, keep)
+    return path
+
+def rotate_backups(backup_dir, keep):
+    """Chỉ giữ lại keep bản sao lưu mới nhất, dọn bản dở dang cũ"""
+    backups = sorted(
+        glob.glob(os.path.join(backup_dir, 'spending-*.db')) +
+        glob.glob(os.path.join(backup_dir, 'spending-*.db.gz'))
+    )
+    for old_backup in backups[:-keep] if keep > 0 else []:
+        os.remove(old_backup)
+    
+    for partial in glob.glob(os.path.join(backup_dir, 'spending-*.partial*')):
+        if os.path.getmtime(partial) < time.time() - BACKUP_STALE_PARTIAL:
+            os.remove(partial)
+
+def restore_backup(backup_path):
+    """Khôi phục cơ sở dữ liệu từ bản sao lưu đã kiểm tra toàn vẹn
+    
+    The snapshot (plain or gzip) is checked with PRAGMA integrity_check
+    before anything is written; a damaged backup raises ValueError and
+    leaves the current database untouched. Run while the bot is stopped."""
+    import gzip
+    import shutil
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        snapshot = backup_path
+        if backup_path.endswith('.gz'):
+            snapshot = os.path.join(tmp_dir, 'restore.db')
+            with gzip.open(backup_path, 'rb') as f_in, open(snapshot, 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+        
+        source = sqlite3.connect(f'file:{snapshot}?mode=ro', uri=True)
+        try:
+            result = source.execute('PRAGMA integrity_check').fetchall()
+            if result != [('ok',)]:
+                raise ValueError(f"Bản sao lưu bị lỗi: {result[0][0]}")
+            
+            target = sqlite3.connect(DB_PATH)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+        finally:
+            source.close()
+
+async def run_backups(backup_dir, interval_hours, compress, keep):
+    """Sao lưu định kỳ trong nền
+    
+    Each backup runs in a worker thread so the event loop keeps serving
+    updates. The first wait is measured from the newest existing backup,
+    so frequent restarts do not postpone backups indefinitely."""
+    interval = interval_hours * 3600
+    loop = asyncio.get_running_loop()
+    
+    backups = glob.glob(os.path.join(backup_dir, 'spending-*.db*'))
+    last_backup = max((os.path.getmtime(path) for path in backups), default=0)
+    
+    while True:
+        await asyncio.sleep(max(0, last_backup + interval - time.time()))
+        last_backup = time.time()
+        try:
+            path = await loop.run_in_executor(None, backup_database, backup_dir, compress, keep)
+            logger.info("Database backed up to %s", path)
+        except Exception:
+            logger.exception("Lỗi sao lưu cơ sở dữ liệu")
 
 # Bot handlers
+def is_group_chat(update):
+    """Tin nhắn đến từ nhóm (sổ chung) thay vì chat riêng"""
+    return update.effective_chat.type != 'private'
+
+def get_member_name(update):
+    """Tên hiển thị của thành viên, chỉ cần lưu cho sổ nhóm"""
+    return update.effective_user.full_name if is_group_chat(update) else None
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    from telegram import KeyboardButton, ReplyKeyboardMarkup
+    
     keyboard = [
         [KeyboardButton("💰 Thêm Thu"), KeyboardButton("💸 Thêm Chi")],
         [KeyboardButton("📊 Xem Tháng Này"), KeyboardButton("🎯 Đặt Ngân Sách")],
@@ -293,7 +1117,11 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /budget <danh mục> <số tiền> - Đặt ngân sách tháng
 /status - Kiểm tra tình trạng ngân sách
 /history - Xem lịch sử giao dịch gần đây
+/find <từ khóa> [tháng YYYY-MM] - Tìm giao dịch theo mô tả
 /delete - Xóa giao dịch cuối cùng
+/recurring add <in|out> <số tiền> <danh mục> <ngày> [mô tả] - Thêm giao dịch định kỳ
+/recurring list - Xem giao dịch định kỳ
+/recurring remove <id> - Xóa giao dịch định kỳ
 /clear <password> - Xóa toàn bộ dữ liệu (cẩn thận!)
 /categories - Xem danh mục thu chi
 
@@ -302,11 +1130,16 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /in 200k ano Tiền thưởng
 /out 50k eat Cafe sáng
 /budget eat 1m
+/recurring add in 5m wrk 5 Lương
+/find cafe 2024-05
 
 🔹 *Đơn vị số tiền:*
 • Không đơn vị = k (50 = 50,000)
 • k = 1,000 VND (50k = 50,000)
 • m = 1,000,000 VND (5m = 5,000,000)
+• Số thập phân: 1.5m, 35.5k
+• Dấu phẩy ngăn cách hàng nghìn: 1,200k (1,200 = 1,200k)
+• Số sau đơn vị: 2m5 = 2,500,000
 
 🔹 *Danh mục THU:*
 • wrk - 💼 Công việc
@@ -344,8 +1177,10 @@ async def add_income_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await update.message.reply_text(f"❌ Danh mục thu không hợp lệ. Chọn:\n{cats}")
             return
         
+        chat_id = update.effective_chat.id
         user_id = update.effective_user.id
-        add_transaction(user_id, 'thu', amount, category, description)
+        add_transaction(chat_id, user_id, 'thu', amount, category, description,
+                        get_member_name(update), update.message.message_id)
         
         cat_display = INCOME_CATEGORIES.get(category)
         
@@ -381,8 +1216,10 @@ async def add_expense_command(update: Update, context: ContextTypes.DEFAULT_TYPE
             await update.message.reply_text(f"❌ Danh mục chi không hợp lệ. Chọn:\n{cats}")
             return
         
+        chat_id = update.effective_chat.id
         user_id = update.effective_user.id
-        add_transaction(user_id, 'chi', amount, category, description)
+        inserted = add_transaction(chat_id, user_id, 'chi', amount, category, description,
+                                   get_member_name(update), update.message.message_id)
         
         cat_display = EXPENSE_CATEGORIES.get(category)
         
@@ -392,20 +1229,35 @@ async def add_expense_command(update: Update, context: ContextTypes.DEFAULT_TYPE
             f"Mô tả: {description if description else 'Không có'}"
         )
         
+        # A redelivered message was already checked when first recorded
+        alert = check_budget_alert(chat_id, category) if inserted else None
+        if alert:
+            if alert['threshold'] >= 100:
+                header = f"🔴 *Vượt ngân sách {cat_display}!*"
+            else:
+                header = f"🟡 *Sắp hết ngân sách {cat_display}*"
+            await update.message.reply_text(
+                f"{header}\n"
+                f"Đã chi: {alert['spent']:,.0f} / {alert['budget']:,.0f} VND "
+                f"({alert['percentage']:.1f}%)",
+                parse_mode='Markdown'
+            )
+        
     except ValueError as e:
         await update.message.reply_text(f"❌ {str(e)}")
     except Exception as e:
         await update.message.reply_text(f"❌ Lỗi thêm chi tiêu: {str(e)}")
 
 async def view_summary(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    income, expenses = get_monthly_summary(user_id)
+    chat_id = update.effective_chat.id
+    income, expenses = get_monthly_summary(chat_id)
     
     if not income and not expenses:
         await update.message.reply_text("📊 Chưa có giao dịch nào trong tháng này.")
         return
     
-    message = "📊 *Tổng kết tháng này:*\n\n"
+    group = is_group_chat(update)
+    message = "📊 *Tổng kết tháng này của nhóm:*\n\n" if group else "📊 *Tổng kết tháng này:*\n\n"
     
     # Income section
     total_income = 0
@@ -427,6 +1279,16 @@ async def view_summary(update: Update, context: ContextTypes.DEFAULT_TYPE):
             total_expenses += amount
         message += f"📉 Tổng chi: *{total_expenses:,.0f} VND*\n\n"
     
+    # Per-member breakdown for group ledgers; names are user-controlled text
+    if group:
+        from telegram.helpers import escape_markdown
+        
+        message += "👥 *THEO THÀNH VIÊN:*\n"
+        for member_id, name, member_income, member_expenses in get_member_summary(chat_id):
+            name = escape_markdown(name) if name else member_id
+            message += f"• {name}: thu {member_income:,.0f} / chi {member_expenses:,.0f} VND\n"
+        message += "\n"
+    
     # Balance
     balance = total_income - total_expenses
     balance_emoji = "💚" if balance >= 0 else "❤️"
@@ -453,8 +1315,8 @@ async def set_budget_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await update.message.reply_text(f"❌ Danh mục không hợp lệ. Chọn:\n{cats}")
             return
         
-        user_id = update.effective_user.id
-        set_budget(user_id, category, amount)
+        chat_id = update.effective_chat.id
+        set_budget(chat_id, category, amount)
         
         cat_display = EXPENSE_CATEGORIES.get(category)
         await update.message.reply_text(
@@ -467,8 +1329,8 @@ async def set_budget_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text(f"❌ Lỗi đặt ngân sách: {str(e)}")
 
 async def budget_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    status = get_budget_status(user_id)
+    chat_id = update.effective_chat.id
+    status = get_budget_status(chat_id)
     
     if not status:
         await update.message.reply_text("🎯 Chưa đặt ngân sách nào cho tháng này.")
@@ -495,16 +1357,19 @@ async def budget_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def view_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Xem lịch sử giao dịch gần đây"""
-    user_id = update.effective_user.id
-    transactions = get_recent_transactions(user_id, 15)
+    from telegram.helpers import escape_markdown
+    
+    chat_id = update.effective_chat.id
+    transactions = get_recent_transactions(chat_id, 15)
     
     if not transactions:
         await update.message.reply_text("📝 Chưa có giao dịch nào được ghi nhận.")
         return
     
+    group = is_group_chat(update)
     message = "📝 *Lịch sử giao dịch gần đây:*\n\n"
     
-    for trans_type, amount, category, description, date in transactions:
+    for trans_type, amount, category, description, date, member_name in transactions:
         # Format date to Hanoi timezone
         date_str = format_hanoi_datetime(date)
         
@@ -519,16 +1384,78 @@ async def view_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
         message += f"{type_emoji} *{amount:,.0f} VND* - {cat_display}\n"
         if description:
             message += f"   📄 {description}\n"
+        if group and member_name:
+            message += f"   👤 {escape_markdown(member_name)}\n"
+        message += f"   🕒 {date_str}\n\n"
+    
+    await update.message.reply_text(message, parse_mode='Markdown')
+
+async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Tìm giao dịch theo mô tả"""
+    from telegram.helpers import escape_markdown
+    
+    args = list(context.args)
+    month = None
+    if args and re.fullmatch(r'\d{4}-\d{2}', args[-1]):
+        month = args.pop()
+    
+    if not args:
+        await update.message.reply_text(
+            "Cách dùng: /find <từ khóa> [tháng YYYY-MM]\n"
+            "Ví dụ: /find grab\n"
+            "Hoặc: /find cafe 2024-05"
+        )
+        return
+    
+    try:
+        chat_id = update.effective_chat.id
+        transactions, totals = search_transactions(chat_id, args, month)
+    except Exception as e:
+        await update.message.reply_text(f"❌ Lỗi tìm kiếm: {str(e)}")
+        return
+    
+    terms = " ".join(args)
+    if not transactions:
+        await update.message.reply_text(f"🔍 Không tìm thấy giao dịch nào khớp với \"{terms}\".")
+        return
+    
+    # Search words and descriptions are user text; Markdown cannot escape
+    # inside an entity, so they stay outside the bold parts
+    period = f" tháng {month}" if month else ""
+    message = f"🔍 *Kết quả tìm{period}:* \"{escape_markdown(terms)}\"\n\n"
+    
+    for trans_type, amount, category, description, date in transactions:
+        date_str = format_hanoi_datetime(date)
+        
+        if trans_type == 'thu':
+            cat_display = INCOME_CATEGORIES.get(category, category)
+            type_emoji = "💰"
+        else:
+            cat_display = EXPENSE_CATEGORIES.get(category, category)
+            type_emoji = "💸"
+        
+        message += f"{type_emoji} *{amount:,.0f} VND* - {cat_display}\n"
+        message += f"   📄 {escape_markdown(description)}\n"
         message += f"   🕒 {date_str}\n\n"
     
+    if 'thu' in totals:
+        total, count = totals['thu']
+        message += f"📈 Tổng thu: *{total:,.0f} VND* ({count} giao dịch)\n"
+    if 'chi' in totals:
+        total, count = totals['chi']
+        message += f"📉 Tổng chi: *{total:,.0f} VND* ({count} giao dịch)\n"
+    
     await update.message.reply_text(message, parse_mode='Markdown')
 
 async def delete_last_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Xóa giao dịch cuối cùng"""
+    chat_id = update.effective_chat.id
     user_id = update.effective_user.id
-    deleted = delete_last_transaction(user_id)
+    deleted = delete_last_transaction(chat_id, user_id, update.message.message_id)
     
-    if deleted:
+    if deleted is False:
+        await update.message.reply_text("ℹ️ Lệnh xóa này đã được xử lý.")
+    elif deleted:
         trans_id, trans_type, amount, category, description, date = deleted
         type_text = "thu nhập" if trans_type == 'thu' else "chi tiêu"
         cat_display = INCOME_CATEGORIES.get(category) if trans_type == 'thu' else EXPENSE_CATEGORIES.get(category)
@@ -543,6 +1470,97 @@ async def delete_last_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     else:
         await update.message.reply_text("❌ Không tìm thấy giao dịch nào để xóa.")
 
+async def recurring_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Quản lý giao dịch định kỳ"""
+    usage = (
+        "Cách dùng:\n"
+        "/recurring add <in|out> <số tiền> <danh mục> <ngày> [mô tả]\n"
+        "/recurring list\n"
+        "/recurring remove <id>\n\n"
+        "Ví dụ: /recurring add in 5m wrk 5 Lương\n"
+        "Hoặc: /recurring add out 200k ser 15 Internet"
+    )
+    try:
+        action = context.args[0].lower() if context.args else ""
+        chat_id = update.effective_chat.id
+        user_id = update.effective_user.id
+        
+        if action == "add":
+            if len(context.args) < 5 or context.args[1].lower() not in ("in", "out"):
+                await update.message.reply_text(usage)
+                return
+            
+            trans_type = 'thu' if context.args[1].lower() == "in" else 'chi'
+            categories = INCOME_CATEGORIES if trans_type == 'thu' else EXPENSE_CATEGORIES
+            amount = parse_amount(context.args[2])
+            category = context.args[3].lower()
+            description = " ".join(context.args[5:]) if len(context.args) > 5 else ""
+            
+            if category not in categories:
+                cats = "\n".join([f"• {k} - {v}" for k, v in categories.items()])
+                await update.message.reply_text(f"❌ Danh mục không hợp lệ. Chọn:\n{cats}")
+                return
+            
+            if not context.args[4].isdigit() or not 1 <= int(context.args[4]) <= 31:
+                await update.message.reply_text("❌ Ngày phải từ 1 đến 31")
+                return
+            day = int(context.args[4])
+            
+            rule_id, next_run = add_recurring(chat_id, user_id, trans_type, amount, category, description, day,
+                                              update.message.message_id)
+            recurring_scheduler.schedule(rule_id, next_run)
+            
+            type_text = "Thu nhập" if trans_type == 'thu' else "Chi tiêu"
+            await update.message.reply_text(
+                f"🔁 Đã thêm {type_text} định kỳ #{rule_id}: {amount:,.0f} VND\n"
+                f"Danh mục: {categories.get(category)}\n"
+                f"Mô tả: {description if description else 'Không có'}\n"
+                f"Ngày {day} hằng tháng, lần tới: {format_hanoi_datetime(next_run)}"
+            )
+        
+        elif action == "list":
+            rules = get_recurring(chat_id)
+            if not rules:
+                await update.message.reply_text("🔁 Chưa có giao dịch định kỳ nào.")
+                return
+            
+            from telegram.helpers import escape_markdown
+            
+            message = "🔁 *Giao dịch định kỳ:*\n\n"
+            for rule_id, trans_type, amount, category, description, day, next_run in rules:
+                if trans_type == 'thu':
+                    cat_display = INCOME_CATEGORIES.get(category, category)
+                    type_emoji = "💰"
+                else:
+                    cat_display = EXPENSE_CATEGORIES.get(category, category)
+                    type_emoji = "💸"
+                
+                message += f"#{rule_id} {type_emoji} *{amount:,.0f} VND* - {cat_display}\n"
+                if description:
+                    message += f"   📄 {escape_markdown(description)}\n"
+                message += f"   📅 Ngày {day} hằng tháng, lần tới: {format_hanoi_datetime(next_run)}\n\n"
+            
+            await update.message.reply_text(message, parse_mode='Markdown')
+        
+        elif action == "remove":
+            if len(context.args) != 2 or not context.args[1].lstrip('#').isdigit():
+                await update.message.reply_text(usage)
+                return
+            
+            rule_id = int(context.args[1].lstrip('#'))
+            if remove_recurring(chat_id, rule_id):
+                await update.message.reply_text(f"🗑️ Đã xóa giao dịch định kỳ #{rule_id}")
+            else:
+                await update.message.reply_text(f"❌ Không tìm thấy giao dịch định kỳ #{rule_id}")
+        
+        else:
+            await update.message.reply_text(usage)
+    
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {str(e)}")
+    except Exception as e:
+        await update.message.reply_text(f"❌ Lỗi giao dịch định kỳ: {str(e)}")
+
 async def clear_data_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Xóa toàn bộ dữ liệu với password bảo vệ"""
     try:
@@ -554,6 +1572,7 @@ async def clear_data_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 "🚨 *CẢNH BÁO:* Lệnh này sẽ xóa:\n"
                 "• Toàn bộ giao dịch thu chi\n"
                 "• Toàn bộ ngân sách đã đặt\n"
+                "• Toàn bộ giao dịch định kỳ\n"
                 "• Không thể khôi phục!\n\n"
                 "Chỉ sử dụng khi chắc chắn muốn bắt đầu lại.",
                 parse_mode='Markdown'
@@ -568,14 +1587,27 @@ async def clear_data_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
             )
             return
         
-        user_id = update.effective_user.id
-        transaction_count, budget_count = clear_all_data(user_id)
+        chat_id = update.effective_chat.id
+        
+        # Only group admins may wipe a shared ledger
+        if is_group_chat(update):
+            member = await context.bot.get_chat_member(chat_id, update.effective_user.id)
+            if member.status not in ('creator', 'administrator'):
+                await update.message.reply_text("❌ Chỉ quản trị viên nhóm mới được xóa dữ liệu của nhóm.")
+                return
         
-        if transaction_count > 0 or budget_count > 0:
+        counts = clear_all_data(chat_id, update.message.message_id)
+        if counts is None:
+            await update.message.reply_text("ℹ️ Lệnh xóa này đã được xử lý.")
+            return
+        transaction_count, budget_count, recurring_count = counts
+        
+        if transaction_count > 0 or budget_count > 0 or recurring_count > 0:
             await update.message.reply_text(
                 f"🗑️ *Đã xóa toàn bộ dữ liệu!*\n\n"
                 f"• {transaction_count} giao dịch\n"
-                f"• {budget_count} ngân sách\n\n"
+                f"• {budget_count} ngân sách\n"
+                f"• {recurring_count} giao dịch định kỳ\n\n"
                 f"✨ Bạn có thể bắt đầu lại từ đầu.",
                 parse_mode='Markdown'
             )
@@ -660,15 +1692,53 @@ async def categories_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     )
 
 def main():
+    import argparse
+    from dotenv import load_dotenv
+    
+    # Load environment variables
+    load_dotenv()
+    
+    parser = argparse.ArgumentParser(description="Spending Manager Telegram Bot")
+    parser.add_argument('--backup', action='store_true', help="sao lưu cơ sở dữ liệu rồi thoát")
+    parser.add_argument('--restore', metavar='FILE', help="khôi phục cơ sở dữ liệu từ bản sao lưu rồi thoát")
+    args = parser.parse_args()
+    
+    # Backup settings
+    backup_dir = os.getenv('BACKUP_DIR', 'backups')
+    backup_interval = float(os.getenv('BACKUP_INTERVAL_HOURS', '24'))
+    backup_keep = int(os.getenv('BACKUP_KEEP', '7'))
+    backup_compress = os.getenv('BACKUP_COMPRESS', '1').lower() not in ('0', 'false', 'no')
+    
+    if args.restore:
+        try:
+            restore_backup(args.restore)
+        except (ValueError, OSError, EOFError, sqlite3.DatabaseError) as e:
+            # OSError covers a missing file and gzip.BadGzipFile, EOFError a truncated .gz
+            print(f"Error: {e}")
+            return
+        print(f"Restored {DB_PATH} from {args.restore}")
+        return
+    
     # Initialize database
     init_db()
     
+    if args.backup:
+        try:
+            path = backup_database(backup_dir, backup_compress, backup_keep)
+        except (OSError, sqlite3.DatabaseError) as e:
+            print(f"Error: {e}")
+            return
+        print(f"Backed up {DB_PATH} to {path}")
+        return
+    
     # Get bot token from environment
     bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
     if not bot_token:
         print("Error: TELEGRAM_BOT_TOKEN not found in environment variables")
         return
     
+    from telegram.ext import Application, CommandHandler, MessageHandler, filters
+    
     # Create application
     application = Application.builder().token(bot_token).build()
     
@@ -681,7 +1751,9 @@ def main():
     application.add_handler(CommandHandler("budget", set_budget_command))
     application.add_handler(CommandHandler("status", budget_status))
     application.add_handler(CommandHandler("history", view_history))
+    application.add_handler(CommandHandler("find", find_command))
     application.add_handler(CommandHandler("delete", delete_last_command))
+    application.add_handler(CommandHandler("recurring", recurring_command))
     application.add_handler(CommandHandler("clear", clear_data_command))
     application.add_handler(CommandHandler("categories", categories_command))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
@@ -689,8 +1761,12 @@ def main():
     # Start the bot
     print("Starting Spending Manager Bot...")
     
+    background_tasks = []
+    
     # Set up bot commands
     async def post_init(application):
+        from telegram import BotCommand
+        
         commands = [
             BotCommand("start", "🏠 Khởi động bot"),
             BotCommand("in", "💰 Thêm thu nhập"),
@@ -699,15 +1775,32 @@ def main():
             BotCommand("budget", "🎯 Đặt ngân sách"),
             BotCommand("status", "📈 Tình trạng ngân sách"),
             BotCommand("history", "📝 Lịch sử giao dịch"),
+            BotCommand("find", "🔍 Tìm giao dịch"),
             BotCommand("delete", "🗑️ Xóa giao dịch cuối"),
+            BotCommand("recurring", "🔁 Giao dịch định kỳ"),
             BotCommand("clear", "⚠️ Xóa toàn bộ dữ liệu"),
             BotCommand("categories", "📋 Xem danh mục"),
             BotCommand("help", "ℹ️ Hướng dẫn sử dụng")
         ]
         await application.bot.set_my_commands(commands)
         print("Bot commands set successfully!")
+        
+        recurring_scheduler.start()
+        
+        if backup_interval > 0:
+            background_tasks.append(asyncio.create_task(
+                run_backups(backup_dir, backup_interval, backup_compress, backup_keep)
+            ))
+    
+    async def post_shutdown(application):
+        await recurring_scheduler.stop()
+        
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
     
     application.post_init = post_init
+    application.post_shutdown = post_shutdown
     application.run_polling()
 
 if __name__ == '__main__':